@@ -18,11 +18,12 @@ import dataclasses
 import datetime
 import enum
 import re
-import time
 
 from mobly.controllers import android_device
 from mobly.controllers.android_device_lib import adb
 
+from betocq import wait_utils
+
 _DELAY_AFTER_CHANGE_WIFI_STATUS = datetime.timedelta(seconds=5)
 _WAIT_FOR_CONNECTION = datetime.timedelta(seconds=30)
 
@@ -92,12 +93,11 @@ def disable_wifi(ad: android_device.AndroidDevice) -> None:
     return
   ad.log.info('Disabling Wi-Fi...')
   ad.adb.shell(['cmd', 'wifi', 'set-wifi-enabled', 'disabled'])
-  start_time = time.monotonic()
-  timeout = start_time + _DELAY_AFTER_CHANGE_WIFI_STATUS.total_seconds()
-  while time.monotonic() < timeout:
-    if not is_wifi_enabled(ad):
-      ad.log.info('Wi-Fi is disabled.')
-      return
+  if wait_utils.wait_for_predicate(
+      lambda: not is_wifi_enabled(ad), _DELAY_AFTER_CHANGE_WIFI_STATUS
+  ):
+    ad.log.info('Wi-Fi is disabled.')
+    return
   raise AndroidWiFiError(
       ad,
       'Fail to disable Wi-Fi after waiting for'
@@ -112,12 +112,11 @@ def enable_wifi(ad: android_device.AndroidDevice) -> None:
     return
   ad.log.info('Enabling Wi-Fi...')
   ad.adb.shell(['cmd', 'wifi', 'set-wifi-enabled', 'enabled'])
-  start_time = time.monotonic()
-  timeout = start_time + _DELAY_AFTER_CHANGE_WIFI_STATUS.total_seconds()
-  while time.monotonic() < timeout:
-    if is_wifi_enabled(ad):
-      ad.log.info('Wi-Fi is enabled.')
-      return
+  if wait_utils.wait_for_predicate(
+      lambda: is_wifi_enabled(ad), _DELAY_AFTER_CHANGE_WIFI_STATUS
+  ):
+    ad.log.info('Wi-Fi is enabled.')
+    return
   raise AndroidWiFiError(
       ad,
       'Fail to enable Wi-Fi after waiting for'
@@ -195,9 +194,6 @@ def _wait_for_data_connected(
     timeout: datetime.timedelta = _WAIT_FOR_CONNECTION,
 ) -> bool:
   """Returns True if data is connected before timeout, False otherwise."""
-  start_time = time.monotonic()
-  timeout = start_time + timeout.total_seconds()
-  while time.monotonic() < timeout:
-    if _is_data_connected(ad):
-      return True
-  return False
+  return wait_utils.wait_for_predicate(
+      lambda: _is_data_connected(ad), timeout
+  )
@@ -84,8 +84,9 @@ class Bt2gWifiCoexTest(d2d_performance_test_base.D2dPerformanceTestBase):
         ' not required for this case.'
     )
 
-  def _is_wifi_ap_ready(self) -> bool:
-    return True if self.test_parameters.wifi_2g_ssid else False
+  @property
+  def _required_wifi_ssids(self) -> tuple[str, ...]:
+    return (self.test_parameters.wifi_2g_ssid,)
 
 
 if __name__ == '__main__':
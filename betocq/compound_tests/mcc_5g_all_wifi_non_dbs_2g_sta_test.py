@@ -90,8 +90,9 @@ class Mcc5gAllWifiNonDbs2gStaTest(
         ' issue in MCC mode'
     )
 
-  def _is_wifi_ap_ready(self) -> bool:
-    return True if self.test_parameters.wifi_2g_ssid else False
+  @property
+  def _required_wifi_ssids(self) -> tuple[str, ...]:
+    return (self.test_parameters.wifi_2g_ssid,)
 
   @property
   def _devices_capabilities_definition(self) -> dict[str, dict[str, bool]]:
@@ -87,8 +87,9 @@ class Scc5gAllWifiStaTest(d2d_performance_test_base.D2dPerformanceTestBase):
         ' chip vendor for any possible FW issue.'
     )
 
-  def _is_wifi_ap_ready(self) -> bool:
-    return True if self.test_parameters.wifi_5g_ssid else False
+  @property
+  def _required_wifi_ssids(self) -> tuple[str, ...]:
+    return (self.test_parameters.wifi_5g_ssid,)
 
   @property
   def _devices_capabilities_definition(self) -> dict[str, dict[str, bool]]:
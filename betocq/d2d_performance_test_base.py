@@ -15,6 +15,8 @@
 """Nearby Connection E2E stress tests for D2D wifi performance."""
 
 import abc
+import bisect
+import collections
 import datetime
 import logging
 import time
@@ -34,6 +36,18 @@ _BITS_PER_BYTE = 8
 _MAX_FREQ_2G_MHZ = 2500
 _MIN_FREQ_5G_DFS_MHZ = 5260
 _MAX_FREQ_5G_DFS_MHZ = 5720
+# Upgrade mediums whose throughput is cross-checked with iperf.
+_IPERF_TEST_MEDIUMS = frozenset({
+    nc_constants.NearbyMedium.UPGRADE_TO_WIFIDIRECT,
+    nc_constants.NearbyMedium.UPGRADE_TO_WIFIHOTSPOT,
+    nc_constants.NearbyMedium.WIFILAN_ONLY,
+    nc_constants.NearbyMedium.WIFIAWARE_ONLY,
+})
+# Connection mediums that run over a Wi-Fi P2P group.
+_P2P_CONNECTION_MEDIUMS = frozenset({
+    nc_constants.NearbyConnectionMedium.WIFI_DIRECT,
+    nc_constants.NearbyConnectionMedium.WIFI_HOTSPOT,
+})
 
 
 class D2dPerformanceTestBase(nc_base_test.NCBaseTestClass, abc.ABC):
@@ -96,20 +110,26 @@ class D2dPerformanceTestBase(nc_base_test.NCBaseTestClass, abc.ABC):
 
   # @typing.override
   def _get_skipped_test_class_reason(self) -> str | None:
+    # The checks are ordered from cheapest to most expensive: the upgrade
+    # medium check may query the devices over snippet RPCs.
     if not self._is_wifi_ap_ready():
       return 'Wifi AP is not ready for this test.'
-    if not self._is_upgrade_medium_supported():
-      return f'{self._upgrade_medium_under_test} is not supported.'
     skip_reason = self._check_devices_capabilities()
     if skip_reason is not None:
       return (
           f'The test is not required per the device capabilities. {skip_reason}'
       )
+    if not self._is_upgrade_medium_supported():
+      return f'{self._upgrade_medium_under_test} is not supported.'
     return None
 
+  @property
   @abc.abstractmethod
+  def _required_wifi_ssids(self) -> tuple[str, ...]:
+    """Returns the SSIDs of the Wi-Fi APs the test requires."""
+
   def _is_wifi_ap_ready(self) -> bool:
-    pass
+    return all(self._required_wifi_ssids)
 
   def _is_upgrade_medium_supported(self) -> bool:
     return True
@@ -140,9 +160,13 @@ class D2dPerformanceTestBase(nc_base_test.NCBaseTestClass, abc.ABC):
         )
     )
     if sta_frequency == nc_constants.INVALID_INT:
-      sta_frequency = setup_utils.get_wifi_sta_frequency(self.advertiser)
+      # Both values are missing, parse them from one dump of the STA status.
+      wifi_sta_status = setup_utils.dump_wifi_sta_status(self.advertiser)
+      sta_frequency = setup_utils.get_wifi_sta_frequency(
+          self.advertiser, wifi_sta_status
+      )
       sta_max_link_speed_mbps = setup_utils.get_wifi_sta_max_link_speed(
-          self.advertiser
+          self.advertiser, wifi_sta_status
       )
     return (sta_frequency, sta_max_link_speed_mbps)
 
@@ -226,8 +250,8 @@ class D2dPerformanceTestBase(nc_base_test.NCBaseTestClass, abc.ABC):
 
         # Cut the speed target by half if TDLS is not supported.
         if (
-            not self.advertiser.nearby.wifiIsTdlsSupported()
-            or not self.discoverer.nearby.wifiIsTdlsSupported()
+            not setup_utils.is_wifi_tdls_supported(self.advertiser)
+            or not setup_utils.is_wifi_tdls_supported(self.discoverer)
         ):
           min_throughput_mbyte_per_sec = min_throughput_mbyte_per_sec / 2
 
@@ -453,10 +477,7 @@ class D2dPerformanceTestBase(nc_base_test.NCBaseTestClass, abc.ABC):
 
     if (
         self._current_test_result.quality_info.upgrade_medium
-        in [
-            nc_constants.NearbyConnectionMedium.WIFI_DIRECT,
-            nc_constants.NearbyConnectionMedium.WIFI_HOTSPOT,
-        ]
+        in _P2P_CONNECTION_MEDIUMS
     ):
       p2p_frequency = setup_utils.get_wifi_p2p_frequency(self.advertiser)
       self._current_test_result.quality_info.medium_frequency = p2p_frequency
@@ -546,12 +567,10 @@ class D2dPerformanceTestBase(nc_base_test.NCBaseTestClass, abc.ABC):
       self, upgrade_medium_under_test: nc_constants.NearbyMedium
   ) -> float:
     iperf_speed_mbps = 0
-    if not self._is_mcc and upgrade_medium_under_test in [
-        nc_constants.NearbyMedium.UPGRADE_TO_WIFIDIRECT,
-        nc_constants.NearbyMedium.UPGRADE_TO_WIFIHOTSPOT,
-        nc_constants.NearbyMedium.WIFILAN_ONLY,
-        nc_constants.NearbyMedium.WIFIAWARE_ONLY,
-    ]:
+    if (
+        not self._is_mcc
+        and upgrade_medium_under_test in _IPERF_TEST_MEDIUMS
+    ):
       # TODO: (internal) - update this part for the connection over WFD.
       self._current_test_result.iperf_throughput_kbps = (
           iperf_utils.run_iperf_test(
@@ -619,22 +638,22 @@ class D2dPerformanceTestBase(nc_base_test.NCBaseTestClass, abc.ABC):
     if self._use_prior_bt:
       prior_nc_info.append(
           'discovery_latency: '
-          f'{round(self._current_test_result.prior_nc_quality_info.discovery_latency.total_seconds(), 1)}'
+          f'{self._current_test_result.prior_nc_quality_info.discovery_latency.total_seconds():.1f}'
       )
       prior_nc_info.append(
           'connection_latency: '
-          f'{round(self._current_test_result.prior_nc_quality_info.connection_latency.total_seconds(), 1)}'
+          f'{self._current_test_result.prior_nc_quality_info.connection_latency.total_seconds():.1f}'
       )
       self.discoverer.log.info(prior_nc_info)
 
     transfer_quality_info: list[Any] = []
     transfer_quality_info.append(
         'discovery_latency: '
-        f'{round(self._current_test_result.quality_info.discovery_latency.total_seconds(), 1)}'
+        f'{self._current_test_result.quality_info.discovery_latency.total_seconds():.1f}'
     )
     transfer_quality_info.append(
         'connection_latency: '
-        f'{round(self._current_test_result.quality_info.connection_latency.total_seconds(), 1)}'
+        f'{self._current_test_result.quality_info.connection_latency.total_seconds():.1f}'
     )
     transfer_quality_info.append(
         'connection_medium: '
@@ -642,7 +661,7 @@ class D2dPerformanceTestBase(nc_base_test.NCBaseTestClass, abc.ABC):
     )
     transfer_quality_info.append(
         'upgrade_latency: '
-        f'{round(self._current_test_result.quality_info.medium_upgrade_latency.total_seconds(), 1)}'
+        f'{self._current_test_result.quality_info.medium_upgrade_latency.total_seconds():.1f}'
     )
     transfer_quality_info.append(
         'upgrade_medium: '
@@ -655,12 +674,12 @@ class D2dPerformanceTestBase(nc_base_test.NCBaseTestClass, abc.ABC):
 
     transfer_quality_info.append(
         'speed_mbps: '
-        f'{round(self._current_test_result.file_transfer_throughput_kbps/1024, 1)}'
+        f'{self._current_test_result.file_transfer_throughput_kbps/1024:.1f}'
     )
     if self._current_test_result.iperf_throughput_kbps > 0:
       transfer_quality_info.append(
           'speed_mbps_iperf: '
-          f'{round(self._current_test_result.iperf_throughput_kbps/1024, 1)}'
+          f'{self._current_test_result.iperf_throughput_kbps/1024:.1f}'
       )
 
     station_connection: list[Any] = []
@@ -869,15 +888,15 @@ class D2dPerformanceTestBase(nc_base_test.NCBaseTestClass, abc.ABC):
         for latency in latency_indicators
         if latency != nc_constants.UNSET_LATENCY
     ]
-    filtered_int = [
-        round(latency)
-        for latency in filtered
-    ]
     if not filtered:
       # All test cases are failed.
       return nc_constants.TestResultStats(0, 0, 0, 0, 0)
 
     filtered.sort()
+    # The latencies which round to 0 lie in [-0.5, 0.5] of the sorted list.
+    zero_count = bisect.bisect_right(filtered, 0.5) - bisect.bisect_left(
+        filtered, -0.5
+    )
 
     percentile_50 = round(
         filtered[int(len(filtered) * nc_constants.PERCENTILE_50_FACTOR)],
@@ -885,7 +904,7 @@ class D2dPerformanceTestBase(nc_base_test.NCBaseTestClass, abc.ABC):
     )
     return nc_constants.TestResultStats(
         len(filtered),
-        filtered_int.count(0),
+        zero_count,
         round(filtered[0], nc_constants.LATENCY_PRECISION_DIGITS),
         percentile_50,
         round(
@@ -1060,12 +1079,11 @@ class D2dPerformanceTestBase(nc_base_test.NCBaseTestClass, abc.ABC):
     return stats
 
   def _summary_upgraded_wifi_transfer_mediums(self) -> list[str]:
-    medium_counts = {}
-    for (
-        upgraded_medium
-    ) in self._performance_test_metrics.upgraded_wifi_transfer_mediums:
-      if upgraded_medium:
-        medium_counts[upgraded_medium.name] = (
-            medium_counts.get(upgraded_medium.name, 0) + 1
+    medium_counts = collections.Counter(
+        upgraded_medium.name
+        for upgraded_medium in (
+            self._performance_test_metrics.upgraded_wifi_transfer_mediums
         )
+        if upgraded_medium
+    )
     return [f' {name}: {count}' for name, count in medium_counts.items()]
@@ -81,9 +81,10 @@ class BtPerformanceTest(d2d_performance_test_base.D2dPerformanceTestBase):
         ' any BT firmware issue.'
     )
 
-  def _is_wifi_ap_ready(self) -> bool:
+  @property
+  def _required_wifi_ssids(self) -> tuple[str, ...]:
     # don't require wifi STA.
-    return True
+    return ()
 
 
 if __name__ == '__main__':
@@ -94,8 +94,9 @@ class Mcc5gHotspotDfs5gStaTest(
         ' possible firmware Tx/Rx issues in MCC mode.'
     )
 
-  def _is_wifi_ap_ready(self) -> bool:
-    return True if self.test_parameters.wifi_dfs_5g_ssid else False
+  @property
+  def _required_wifi_ssids(self) -> tuple[str, ...]:
+    return (self.test_parameters.wifi_dfs_5g_ssid,)
 
   @property
   def _devices_capabilities_definition(self) -> dict[str, dict[str, bool]]:
@@ -78,19 +78,18 @@ class MccAwareStaTest(d2d_performance_test_base.D2dPerformanceTestBase):
         ' used wifi medium.'
     )
 
-  def _is_wifi_ap_ready(self) -> bool:
+  @property
+  def _required_wifi_ssids(self) -> tuple[str, ...]:
     return (
-        True
-        if self.test_parameters.wifi_5g_ssid
-        and self.test_parameters.wifi_dfs_5g_ssid
-        else False
+        self.test_parameters.wifi_5g_ssid,
+        self.test_parameters.wifi_dfs_5g_ssid,
     )
 
   # @typing.override
   def _is_upgrade_medium_supported(self) -> bool:
-    return setup_utils.is_wifi_aware_available(
-        self.advertiser
-    ) and setup_utils.is_wifi_aware_available(self.discoverer)
+    return setup_utils.is_wifi_aware_available_on_all(
+        [self.advertiser, self.discoverer]
+    )
 
   @property
   def _devices_capabilities_definition(self) -> dict[str, dict[str, bool]]:
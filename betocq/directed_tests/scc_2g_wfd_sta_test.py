@@ -81,8 +81,9 @@ class Scc2gWfdStaTest(d2d_performance_test_base.D2dPerformanceTestBase):
         ' vendor about the possible firmware Tx/Rx issues in this mode.'
     )
 
-  def _is_wifi_ap_ready(self) -> bool:
-    return True if self.test_parameters.wifi_2g_ssid else False
+  @property
+  def _required_wifi_ssids(self) -> tuple[str, ...]:
+    return (self.test_parameters.wifi_2g_ssid,)
 
 
 if __name__ == '__main__':
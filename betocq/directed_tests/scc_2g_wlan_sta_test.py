@@ -84,8 +84,9 @@ class Scc2gWlanStaTest(d2d_performance_test_base.D2dPerformanceTestBase):
         ' the AP has the firewall which could block the mDNS traffic.'
     )
 
-  def _is_wifi_ap_ready(self) -> bool:
-    return True if self.test_parameters.wifi_2g_ssid else False
+  @property
+  def _required_wifi_ssids(self) -> tuple[str, ...]:
+    return (self.test_parameters.wifi_2g_ssid,)
 
   @property
   def _devices_capabilities_definition(self) -> dict[str, dict[str, bool]]:
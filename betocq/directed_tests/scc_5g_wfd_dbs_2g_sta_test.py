@@ -76,8 +76,9 @@ class Scc5gWfdDbs2gStaTest(d2d_performance_test_base.D2dPerformanceTestBase):
         ' the possible firmware Tx/Rx issues in this mode.'
     )
 
-  def _is_wifi_ap_ready(self) -> bool:
-    return True if self.test_parameters.wifi_2g_ssid else False
+  @property
+  def _required_wifi_ssids(self) -> tuple[str, ...]:
+    return (self.test_parameters.wifi_2g_ssid,)
 
   @property
   def _devices_capabilities_definition(self) -> dict[str, dict[str, bool]]:
@@ -85,8 +85,9 @@ class BetoCqFunctionGroupTest(nc_base_test.NCBaseTestClass):
     """
     if (
         not self.test_parameters.run_aware_test
-        or not setup_utils.is_wifi_aware_available(self.advertiser)
-        or not setup_utils.is_wifi_aware_available(self.discoverer)
+        or not setup_utils.is_wifi_aware_available_on_all(
+            [self.advertiser, self.discoverer]
+        )
     ):
       asserts.skip(
           'aware test is disabled or aware is not available in the device'
@@ -50,8 +50,22 @@ _ENABLE_GSERVICES_CMD_TEMPLATE = [
 class GmsAutoUpdatesUtil:
   """class to enable/disable GMS auto updates."""
 
-  def __init__(self, ad: android_device.AndroidDevice):
+  def __init__(
+      self,
+      ad: android_device.AndroidDevice,
+      is_adb_root: bool | None = None,
+  ):
+    """Initializes the util.
+
+    Args:
+      ad: AndroidDevice, Mobly Android Device.
+      is_adb_root: Whether adb runs as root on the device, if the caller
+        already knows it. Otherwise it is queried from the device.
+    """
     self._device: android_device.AndroidDevice = ad
+    self._is_adb_root: bool = (
+        ad.is_adb_root if is_adb_root is None else is_adb_root
+    )
 
   def enable_gms_auto_updates(self) -> None:
     self._config_gms_auto_updates(True)
@@ -61,7 +75,7 @@ class GmsAutoUpdatesUtil:
 
   def _config_gms_auto_updates(self, enable_updates: bool) -> None:
     """Configures GMS auto updates."""
-    if not self._device.is_adb_root:
+    if not self._is_adb_root:
       self._device.log.info(
           f'failed to set the play store auto updates as {enable_updates}'
           'you should enable/disable it manually on an unrooted device.')
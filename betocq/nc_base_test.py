@@ -27,8 +27,8 @@ from mobly import base_test
 from mobly import records
 from mobly import utils
 from mobly.controllers import android_device
-from mobly.controllers.android_device_lib import apk_utils
 from mobly.controllers.android_device_lib import errors
+from mobly.controllers.android_device_lib import snippet_client_v2
 from mobly.controllers.wifi import openwrt_device
 from mobly.controllers.wifi.lib import wifi_configs
 import yaml
@@ -63,6 +63,10 @@ class NCBaseTestClass(base_test.BaseTestClass):
         nc_constants.TestParameters.from_user_params(self.user_params)
     )
     self._test_result_messages: dict[str, str] = {}
+    # Static summary attributes of each device, keyed by serial. They do not
+    # change within a test class, but the summary may be generated more than
+    # once.
+    self._device_attributes: dict[str, list[str]] = {}
     self._nearby_snippet_apk_path: str = None
     self._nearby_snippet_2_apk_path: str = None
     self._nearby_snippet_3p_apk_path: str = None
@@ -101,12 +105,6 @@ class NCBaseTestClass(base_test.BaseTestClass):
       )
       self.advertiser, self.discoverer = self.ads
 
-    utils.concurrent_exec(
-        self._setup_android_hw_capability,
-        param_list=[[ad] for ad in self.ads],
-        raise_on_exception=True,
-    )
-
     file_tag = 'files' if 'files' in self.user_params else 'mh_files'
     self._nearby_snippet_apk_path = self.user_params.get(file_tag, {}).get(
         'nearby_snippet', ['']
@@ -122,15 +120,10 @@ class NCBaseTestClass(base_test.BaseTestClass):
           'nearby_snippet_3p', ['']
       )[0]
 
-    # disconnect from all wifi automatically
+    # Each device runs all of its setup steps on its own thread, so a fast
+    # device does not wait for a slow one between the steps.
     utils.concurrent_exec(
-        android_wifi_utils.forget_all_wifi,
-        param_list=[[ad] for ad in self.ads],
-        raise_on_exception=True,
-    )
-
-    utils.concurrent_exec(
-        self._setup_android_device,
+        self._setup_android_device_all_steps,
         param_list=[[ad] for ad in self.ads],
         raise_on_exception=True,
     )
@@ -221,10 +214,21 @@ class NCBaseTestClass(base_test.BaseTestClass):
     else:
       raise ValueError('Unknown Wi-Fi channel: %s' % wifi_channel)
 
+  def _setup_android_device_all_steps(
+      self, ad: android_device.AndroidDevice
+  ) -> None:
+    self._setup_android_hw_capability(ad)
+    # disconnect from all wifi automatically
+    android_wifi_utils.forget_all_wifi(ad)
+    self._setup_android_device(ad)
+
   def _setup_android_hw_capability(
       self, ad: android_device.AndroidDevice
   ) -> None:
-    ad.android_version = int(ad.adb.getprop('ro.build.version.release'))
+    # Read all the properties needed by the setup with one getprop call.
+    props = ad.adb.getprops(['ro.build.version.release', 'ro.product.model'])
+    ad.android_version = int(props.get('ro.build.version.release', ''))
+    ad.debug_tag = f'{ad.serial}({props.get("ro.product.model", "")})'
 
     if not os.path.isfile(_CONFIG_EXTERNAL_PATH):
       return
@@ -254,13 +258,12 @@ class NCBaseTestClass(base_test.BaseTestClass):
     return virtualization_type == _CUTTLEFISH_VIRTUALIZATION_TYPE
 
   def _setup_android_device(self, ad: android_device.AndroidDevice) -> None:
-    ad.debug_tag = ad.serial + '(' + ad.adb.getprop('ro.product.model') + ')'
     if self._is_cuttlefish_device(ad):
       ad.adb.shell(
           ['settings', 'put', 'global', 'verifier_verify_adb_installs', '0']
       )
       self._disable_play_protect(ad)
-    if not ad.is_adb_root:
+    if not setup_utils.is_adb_root(ad):
       if self.test_parameters.allow_unrooted_device:
         ad.log.info('Unrooted device is detected. Test coverage is limited')
       else:
@@ -268,10 +271,14 @@ class NCBaseTestClass(base_test.BaseTestClass):
 
     setup_utils.disable_gms_auto_updates(ad)
 
-    ad.debug_tag = ad.serial + '(' + ad.adb.getprop('ro.product.model') + ')'
     ad.log.info('try to install nearby_snippet_apk')
     if self._nearby_snippet_apk_path:
-      apk_utils.install(ad, self._nearby_snippet_apk_path)
+      setup_utils.install_apk_if_changed(
+          ad,
+          self._nearby_snippet_apk_path,
+          NEARBY_SNIPPET_PACKAGE_NAME,
+          force_reinstall=self.test_parameters.force_reinstall_snippet_apks,
+      )
     else:
       ad.log.warning(
           'nearby_snippet apk is not specified, '
@@ -286,7 +293,12 @@ class NCBaseTestClass(base_test.BaseTestClass):
     if self._requires_2_snippet_apks:
       ad.log.info('try to install nearby_snippet_2_apk')
       if self._nearby_snippet_2_apk_path:
-        apk_utils.install(ad, self._nearby_snippet_2_apk_path)
+        setup_utils.install_apk_if_changed(
+            ad,
+            self._nearby_snippet_2_apk_path,
+            NEARBY_SNIPPET_2_PACKAGE_NAME,
+            force_reinstall=self.test_parameters.force_reinstall_snippet_apks,
+        )
       else:
         ad.log.warning(
             'nearby_snippet_2 apk is not specified, '
@@ -300,7 +312,12 @@ class NCBaseTestClass(base_test.BaseTestClass):
     if self._requires_3p_snippet_apks:
       ad.log.info('try to install nearby_snippet_3p_apk')
       if self._nearby_snippet_3p_apk_path:
-        apk_utils.install(ad, self._nearby_snippet_3p_apk_path)
+        setup_utils.install_apk_if_changed(
+            ad,
+            self._nearby_snippet_3p_apk_path,
+            NEARBY_SNIPPET_3P_PACKAGE_NAME,
+            force_reinstall=self.test_parameters.force_reinstall_snippet_apks,
+        )
       else:
         ad.log.warning(
             'nearby_snippet_3p apk is not specified, '
@@ -327,8 +344,8 @@ class NCBaseTestClass(base_test.BaseTestClass):
     )
     if not self.test_parameters.bypass_airplane_mode_toggling:
       setup_utils.toggle_airplane_mode(ad)
-    if not ad.nearby.wifiIsEnabled():
-      ad.nearby.wifiEnable()
+    # wifiEnable() returns right away if Wi-Fi is already enabled.
+    ad.nearby.wifiEnable()
 
   def setup_test(self):
     self.record_data({
@@ -363,23 +380,39 @@ class NCBaseTestClass(base_test.BaseTestClass):
     )
 
   def _reset_nearby_connection(self) -> None:
-    """Resets nearby connection."""
-    self.discoverer.nearby.stopDiscovery()
-    self.discoverer.nearby.stopAllEndpoints()
-    self.advertiser.nearby.stopAdvertising()
-    self.advertiser.nearby.stopAllEndpoints()
+    """Resets nearby connection.
+
+    Each snippet client has its own connection to the device, so the stop RPCs
+    of different snippets run concurrently and the reset takes as long as the
+    slowest snippet instead of the sum of all of them.
+    """
+    snippet_names = ['nearby']
     if self.__loaded_2_nearby_snippets:
-      self.discoverer.nearby2.stopDiscovery()
-      self.discoverer.nearby2.stopAllEndpoints()
-      self.advertiser.nearby2.stopAdvertising()
-      self.advertiser.nearby2.stopAllEndpoints()
+      snippet_names.append('nearby2')
     if self.__loaded_3p_nearby_snippets:
-      self.discoverer.nearby3p.stopDiscovery()
-      self.discoverer.nearby3p.stopAllEndpoints()
-      self.advertiser.nearby3p.stopAdvertising()
-      self.advertiser.nearby3p.stopAllEndpoints()
+      snippet_names.append('nearby3p')
+    param_list = []
+    for snippet_name in snippet_names:
+      param_list.append(
+          [getattr(self.discoverer, snippet_name), 'stopDiscovery']
+      )
+      param_list.append(
+          [getattr(self.advertiser, snippet_name), 'stopAdvertising']
+      )
+    utils.concurrent_exec(
+        self._stop_nearby_snippet,
+        param_list=param_list,
+        raise_on_exception=True,
+    )
     time.sleep(nc_constants.NEARBY_RESET_WAIT_TIME.total_seconds())
 
+  def _stop_nearby_snippet(
+      self, snippet: snippet_client_v2.SnippetClientV2, stop_rpc_name: str
+  ) -> None:
+    """Stops discovery or advertising, then disconnects all endpoints."""
+    getattr(snippet, stop_rpc_name)()
+    snippet.stopAllEndpoints()
+
   def _teardown_device(self, ad: android_device.AndroidDevice) -> None:
     ad.nearby.transferFilesCleanup()
     setup_utils.enable_gms_auto_updates(ad)
@@ -392,6 +425,7 @@ class NCBaseTestClass(base_test.BaseTestClass):
       ad.unload_snippet('nearby2')
     if self.__loaded_3p_nearby_snippets:
       ad.unload_snippet('nearby3p')
+    setup_utils.reset_device_caches(ad)
 
   def teardown_test(self) -> None:
     utils.concurrent_exec(
@@ -424,6 +458,17 @@ class NCBaseTestClass(base_test.BaseTestClass):
 
   def _get_device_attributes(
       self, ad: android_device.AndroidDevice
+  ) -> list[str]:
+    if ad.serial not in self._device_attributes:
+      self._device_attributes[ad.serial] = self._read_device_attributes(ad)
+    # Aware availability changes at runtime, e.g. with the Wi-Fi state, so it
+    # is queried every time instead of being cached.
+    return self._device_attributes[ad.serial] + [
+        f'support_aware: {setup_utils.is_wifi_aware_available(ad)}'
+    ]
+
+  def _read_device_attributes(
+      self, ad: android_device.AndroidDevice
   ) -> list[str]:
     return [
         f'serial: {ad.serial}',
@@ -444,25 +489,32 @@ class NCBaseTestClass(base_test.BaseTestClass):
         ),
         f'max_num_streams: {ad.max_num_streams}',
         f'max_num_streams_dbs: {ad.max_num_streams_dbs}',
-        f'support_aware: {setup_utils.is_wifi_aware_available(ad)}',
     ]
 
   def _get_test_summary_dict(self, test_result: str) -> dict[str, str]:
     """Returns test summary dictionary."""
+    # The device queries are independent reads, so run them concurrently.
+    # concurrent_exec returns results in completion order, so each result is
+    # keyed by the serial of its device.
+    attributes = dict(
+        utils.concurrent_exec(
+            lambda ad: (ad.serial, self._get_device_attributes(ad)),
+            param_list=[[self.discoverer], [self.advertiser]],
+            raise_on_exception=True,
+        )
+    )
+    source_attributes = attributes[self.discoverer.serial]
+    target_attributes = attributes[self.advertiser.serial]
+    # Cached by the attribute query above.
+    target_gms_version = setup_utils.dump_gms_version(self.advertiser)
     return {
         '00_test_script_verion': version.TEST_SCRIPT_VERSION,
         '01_test_result': test_result,
-        '02_device_source': '\n'.join(
-            self._get_device_attributes(self.discoverer)
-        ),
-        '03_device_target': '\n'.join(
-            self._get_device_attributes(self.advertiser)
-        ),
+        '02_device_source': '\n'.join(source_attributes),
+        '03_device_target': '\n'.join(target_attributes),
         '04_target_build_id': f'{self.advertiser.build_info["build_id"]}',
         '05_target_model': f'{self.advertiser.model}',
-        '06_target_gms_version': (
-            f'{setup_utils.dump_gms_version(self.advertiser)}'
-        ),
+        '06_target_gms_version': f'{target_gms_version}',
         '07_target_wifi_chipset': f'{self.advertiser.wifi_chipset}',
     }
 
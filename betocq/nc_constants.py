@@ -170,6 +170,7 @@ class TestParameters:
       WIFI_500M_PAYLOAD_TRANSFER_TIMEOUT.total_seconds()
   )
   allow_unrooted_device: bool = False
+  force_reinstall_snippet_apks: bool = False
   keep_alive_timeout_ms: int = KEEP_ALIVE_TIMEOUT_WIFI_MS
   keep_alive_interval_ms: int = KEEP_ALIVE_INTERVAL_WIFI_MS
   enable_2g_ble_scan_throttling: bool = True
@@ -492,7 +493,9 @@ class SingleTestResult:
   advertiser_wifi_expected: bool = False
   sta_frequency: int = INVALID_INT
   max_sta_link_speed_mbps: int = INVALID_INT
-  start_time: datetime.datetime = datetime.datetime.now()
+  start_time: datetime.datetime = dataclasses.field(
+      default_factory=datetime.datetime.now
+  )
 
 
 @dataclasses.dataclass(frozen=False)
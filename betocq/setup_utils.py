@@ -15,15 +15,25 @@
 """Android Nearby device setup."""
 
 import datetime
+import functools
+import hashlib
+import random
+import re
+import shlex
 import time
+from typing import Sequence
 
+from mobly import utils
 from mobly.controllers import android_device
 from mobly.controllers.android_device_lib import adb
 
-from betocq.gms import hermetic_overrides_partner
-from betocq import gms_auto_updates_util
+from betocq import android_wifi_utils
 from betocq import nc_constants
-from betocq import resources
+from betocq import wait_utils
+
+# apk_utils, gms_auto_updates_util, hermetic_overrides_partner and resources
+# are imported in the functions using them, so helpers like set_country_code
+# and enable_logs do not pay for their transitive imports.
 
 _DEFAULT_OVERRIDES = '//wireless/android/platform/testing/bettertogether/betocq:default_overrides'
 _BLE_SCAN_THROTTLING_OFF_OVERRIDES = '//wireless/android/platform/testing/bettertogether/betocq:ble_scan_throttling_off_overrides'
@@ -35,14 +45,32 @@ _GMS_PACKAGE = 'com.google.android.gms'
 
 WIFI_COUNTRYCODE_CONFIG_TIME_SEC = 3
 TOGGLE_AIRPLANE_MODE_WAIT_TIME_SEC = 2
-PH_FLAG_WRITE_WAIT_TIME_SEC = 3
 WIFI_DISCONNECTION_DELAY_SEC = 3
-ADB_RETRY_WAIT_TIME_SEC = 2
+# Backoff before each retry of a failed adb command; the last failure raises.
+ADB_RETRY_BACKOFF_SEC = (0.2, 0.6)
 
 _DISABLE_ENABLE_GMS_UPDATE_WAIT_TIME_SEC = 2
 
+# Matches the BSSID, frequency and RSSI columns at the start of a line of
+# 'cmd wifi list-scan-results', and captures the RSSI.
+_SCAN_RESULT_RSSI_PATTERN = re.compile(r'\S+\s+\d+\s+(-?\d+)\s')
+
+# Matches the adapter state line of 'dumpsys bluetooth_manager'.
+_BLUETOOTH_STATE_PATTERN = re.compile(r'state:\s*(\w+)')
+# The adapter states with classic Bluetooth off. BLE_ON stays on when BLE
+# scanning is always available.
+_BLUETOOTH_OFF_STATES = ('OFF', 'BLE_ON')
+
+# Whether adb runs as root, keyed by device serial. AndroidDevice.is_adb_root
+# runs an adb shell command on every access.
+_is_adb_root_cache: dict[str, bool] = {}
 
-read_ph_flag_failed = False
+# GMS version code, keyed by device serial. GMS auto updates are disabled while
+# the test runs, so the version does not change until the device is torn down.
+_gms_version_cache: dict[str, int] = {}
+
+# Whether the Wi-Fi chip supports TDLS, keyed by device serial.
+_is_wifi_tdls_supported_cache: dict[str, bool] = {}
 
 NEARBY_LOG_TAGS = [
     'Nearby',
@@ -54,6 +82,50 @@ NEARBY_LOG_TAGS = [
 ]
 
 
+def _retry_on_adb_error(func):
+  """Retries the decorated device function on AdbError with backoff.
+
+  The first argument of the decorated function must be the AndroidDevice. Each
+  retry waits for the next delay of ADB_RETRY_BACKOFF_SEC plus a small jitter,
+  and the error of the last attempt is raised to the caller.
+
+  Args:
+    func: The function to retry, called as func(ad, *args, **kwargs).
+
+  Returns:
+    The wrapped function.
+  """
+
+  @functools.wraps(func)
+  def wrapper(ad: android_device.AndroidDevice, *args, **kwargs):
+    for delay_sec in ADB_RETRY_BACKOFF_SEC:
+      try:
+        return func(ad, *args, **kwargs)
+      except adb.AdbError:
+        ad.log.exception(
+            f'Failed to run {func.__name__} on device "{ad.serial}", try'
+            ' again.'
+        )
+        time.sleep(delay_sec + random.uniform(0, delay_sec / 2))
+    return func(ad, *args, **kwargs)
+
+  return wrapper
+
+
+def is_adb_root(ad: android_device.AndroidDevice) -> bool:
+  """Returns whether adb runs as root on the device, cached per serial."""
+  if ad.serial not in _is_adb_root_cache:
+    _is_adb_root_cache[ad.serial] = ad.is_adb_root
+  return _is_adb_root_cache[ad.serial]
+
+
+def reset_device_caches(ad: android_device.AndroidDevice) -> None:
+  """Drops the cached device state, e.g. after the device was rebooted."""
+  _is_adb_root_cache.pop(ad.serial, None)
+  _gms_version_cache.pop(ad.serial, None)
+  _is_wifi_tdls_supported_cache.pop(ad.serial, None)
+
+
 def set_country_code(
     ad: android_device.AndroidDevice,
     country_code: str,
@@ -72,23 +144,7 @@ def set_country_code(
     country_code: WiFi and Telephony Country Code.
     force_telephony_cc: True to force Telephony Country Code.
   """
-  try:
-    _do_set_country_code(ad, country_code, force_telephony_cc)
-  except adb.AdbError:
-    ad.log.exception(
-        f'Failed to set country code on device "{ad.serial}, try again.'
-    )
-    time.sleep(ADB_RETRY_WAIT_TIME_SEC)
-    _do_set_country_code(ad, country_code)
-
-
-def _do_set_country_code(
-    ad: android_device.AndroidDevice,
-    country_code: str,
-    force_telephony_cc: bool = False,
-) -> None:
-  """Sets Wi-Fi and Telephony country code."""
-  if not ad.is_adb_root:
+  if not is_adb_root(ad):
     ad.log.info(
         f'Skipped setting wifi country code on device "{ad.serial}" '
         'because we do not set country code on unrooted phone.'
@@ -96,22 +152,62 @@ def _do_set_country_code(
     return
 
   ad.log.info(f'Set Wi-Fi country code to {country_code}.')
-  ad.adb.shell('cmd wifi set-wifi-enabled disabled')
-  time.sleep(WIFI_COUNTRYCODE_CONFIG_TIME_SEC)
+  # Only the leaf steps retry on AdbError. toggle_airplane_mode retries its
+  # own steps, so retrying the whole sequence would multiply the attempts.
+  _disable_wifi_for_country_code(ad)
   if force_telephony_cc:
     ad.log.info(f'Set Telephony country code to {country_code}.')
-    ad.adb.shell(
-        'am broadcast -a com.android.internal.telephony.action.COUNTRY_OVERRIDE'
-        f' --es country {country_code}'
-    )
+    _override_telephony_country_code(ad, country_code)
     toggle_airplane_mode(ad)
-  ad.adb.shell(f'cmd wifi force-country-code enabled {country_code}')
-  ad.adb.shell('cmd wifi set-wifi-enabled enabled')
+  _force_wifi_country_code(ad, country_code, force_telephony_cc)
+
+
+@_retry_on_adb_error
+def _disable_wifi_for_country_code(ad: android_device.AndroidDevice) -> None:
+  """Disables Wi-Fi so that a new country code can be applied."""
+  ad.adb.shell('cmd wifi set-wifi-enabled disabled')
+  # Proceed as soon as Wi-Fi reports disabled, but no later than the config
+  # time which was the fixed wait before.
+  wait_utils.wait_for_predicate(
+      lambda: not android_wifi_utils.is_wifi_enabled(ad),
+      timeout=datetime.timedelta(seconds=WIFI_COUNTRYCODE_CONFIG_TIME_SEC),
+  )
+
+
+@_retry_on_adb_error
+def _override_telephony_country_code(
+    ad: android_device.AndroidDevice, country_code: str
+) -> None:
+  """Overrides the Telephony country code."""
+  ad.adb.shell(
+      'am broadcast -a com.android.internal.telephony.action.COUNTRY_OVERRIDE'
+      f' --es country {country_code}'
+  )
+
+
+@_retry_on_adb_error
+def _force_wifi_country_code(
+    ad: android_device.AndroidDevice,
+    country_code: str,
+    force_telephony_cc: bool,
+) -> None:
+  """Forces the Wi-Fi country code and enables Wi-Fi again."""
+  cmds = [
+      f'cmd wifi force-country-code enabled {country_code}',
+      'cmd wifi set-wifi-enabled enabled',
+  ]
   if force_telephony_cc:
-    telephony_country_code = (
-        ad.adb.shell('dumpsys wifi | grep mTelephonyCountryCode')
-        .decode('utf-8')
-        .strip()
+    cmds.append('dumpsys wifi | grep -m1 mTelephonyCountryCode')
+  out = ad.adb.shell(' && '.join(cmds)).decode('utf-8')
+  if force_telephony_cc:
+    # The wifi commands may write to stdout too, so pick the queried line.
+    telephony_country_code = next(
+        (
+            line.strip()
+            for line in out.splitlines()
+            if 'mTelephonyCountryCode' in line
+        ),
+        '',
     )
     ad.log.info(f'Telephony country code: {telephony_country_code}')
 
@@ -119,42 +215,30 @@ def _do_set_country_code(
 def enable_logs(ad: android_device.AndroidDevice) -> None:
   """Enables Nearby, WiFi and BT detailed logs."""
   ad.log.info('Enable Nearby loggings.')
-  for tag in NEARBY_LOG_TAGS:
-    ad.adb.shell(f'setprop log.tag.{tag} VERBOSE')
+  cmds = [f'setprop log.tag.{tag} VERBOSE' for tag in NEARBY_LOG_TAGS]
 
   # Enable WiFi verbose logging.
-  ad.adb.shell('cmd wifi set-verbose-logging enabled')
+  cmds.append('cmd wifi set-verbose-logging enabled')
 
-  # Enable Bluetooth HCI logs.
-  if not ad.is_adb_root:
+  if is_adb_root(ad):
+    # Enable Bluetooth HCI logs.
+    cmds.append('setprop persist.bluetooth.btsnooplogmode full')
+    # Enable Bluetooth verbose logs.
+    cmds.append('setprop persist.log.tag.bluetooth VERBOSE')
+  else:
     ad.log.info(
         'Skipped setting Bluetooth HCI logs on device,'
         'because we do not set Bluetooth HCI logs on unrooted phone.'
     )
-    return
-  ad.adb.shell('setprop persist.bluetooth.btsnooplogmode full')
 
-  # Enable Bluetooth verbose logs.
-  ad.adb.shell('setprop persist.log.tag.bluetooth VERBOSE')
+  # Apply the settings in one shell call. They are chained with && so that a
+  # failing setting still raises AdbError, as the separate calls did.
+  ad.adb.shell(' && '.join(cmds))
 
 
+@_retry_on_adb_error
 def grant_manage_external_storage_permission(
     ad: android_device.AndroidDevice, package_name: str
-) -> None:
-  """Grants MANAGE_EXTERNAL_STORAGE permission to Nearby snippet."""
-  try:
-    _do_grant_manage_external_storage_permission(ad, package_name)
-  except adb.AdbError:
-    ad.log.exception(
-        'Failed to grant MANAGE_EXTERNAL_STORAGE permission on device'
-        f' "{ad.serial}", try again.'
-    )
-    time.sleep(ADB_RETRY_WAIT_TIME_SEC)
-    _do_grant_manage_external_storage_permission(ad, package_name)
-
-
-def _do_grant_manage_external_storage_permission(
-    ad: android_device.AndroidDevice, package_name: str
 ) -> None:
   """Grants MANAGE_EXTERNAL_STORAGE permission to Nearby snippet."""
   build_version_sdk = int(ad.build_info['build_version_sdk'])
@@ -166,33 +250,78 @@ def _do_grant_manage_external_storage_permission(
   _grant_manage_external_storage_permission(ad, package_name)
 
 
-def dump_gms_version(ad: android_device.AndroidDevice) -> int:
-  """Dumps GMS version from dumpsys to sponge properties."""
+def _get_file_sha256(file_path: str) -> str:
+  """Returns the hex SHA-256 digest of a file on the host."""
+  sha256 = hashlib.sha256()
+  with open(file_path, 'rb') as f:
+    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+      sha256.update(chunk)
+  return sha256.hexdigest()
+
+
+def _get_installed_apk_sha256(
+    ad: android_device.AndroidDevice, package_name: str
+) -> str | None:
+  """Returns the SHA-256 digest of the installed APK, or None if absent."""
   try:
-    gms_version = _do_dump_gms_version(ad)
-  except adb.AdbError:
-    ad.log.exception(
-        f'Failed to dump GMS version on device "{ad.serial}", try again.'
+    out = ad.adb.shell(
+        f'p=$(pm path {package_name} | grep -m1 base.apk | cut -d: -f2)'
+        ' && [ -n "$p" ] && sha256sum "$p"'
     )
-    time.sleep(ADB_RETRY_WAIT_TIME_SEC)
-    gms_version = _do_dump_gms_version(ad)
-  return gms_version
+  except adb.AdbError:
+    return None
+  digest = out.decode('utf-8').split()
+  return digest[0] if digest else None
+
+
+def install_apk_if_changed(
+    ad: android_device.AndroidDevice,
+    apk_path: str,
+    package_name: str,
+    force_reinstall: bool = False,
+) -> None:
+  """Installs the APK unless the exact same APK is already on the device.
+
+  Args:
+    ad: AndroidDevice, Mobly Android Device.
+    apk_path: The host path of the APK to install.
+    package_name: The package name of the APK.
+    force_reinstall: True to install even if the APK is already installed.
+  """
+  if not force_reinstall and _get_installed_apk_sha256(
+      ad, package_name
+  ) == _get_file_sha256(apk_path):
+    ad.log.info(f'{package_name} is up to date, skip installing it.')
+    return
+  from mobly.controllers.android_device_lib import apk_utils  # pylint: disable=g-import-not-at-top
+
+  apk_utils.install(ad, apk_path)
 
 
-def _do_dump_gms_version(ad: android_device.AndroidDevice) -> int:
+def dump_gms_version(ad: android_device.AndroidDevice) -> int:
   """Dumps GMS version from dumpsys to sponge properties."""
+  if ad.serial not in _gms_version_cache:
+    gms_version = _dump_gms_version(ad)
+    if gms_version == nc_constants.INVALID_INT:
+      return gms_version
+    _gms_version_cache[ad.serial] = gms_version
+  return _gms_version_cache[ad.serial]
+
+
+@_retry_on_adb_error
+def _dump_gms_version(ad: android_device.AndroidDevice) -> int:
+  """Reads the GMS version code from dumpsys on the device."""
+  # Extract the first versionCode on device so only the digits are returned.
   out = (
       ad.adb.shell(
-          'dumpsys package com.google.android.gms | grep "versionCode="'
+          'dumpsys package com.google.android.gms | grep -m1 "versionCode="'
+          " | sed -E 's/.*versionCode=([0-9]+).*/\\1/'"
       )
       .decode('utf-8')
       .strip()
   )
   ad.log.info(f'GMS version: {out}')
-  prefix = 'versionCode='
-  postfix = 'minSdk'
-  search_last = False
-  return get_int_between_prefix_postfix(out, prefix, postfix, search_last)
+  return int(out) if out.isdigit() else nc_constants.INVALID_INT
 
 
 def toggle_airplane_mode(ad: android_device.AndroidDevice) -> None:
@@ -221,8 +350,8 @@ def connect_to_wifi(
     password: str | None = None,
 ) -> None:
   """Connects to the specified wifi AP and raise exception if failed."""
-  if not ad.nearby.wifiIsEnabled():
-    ad.nearby.wifiEnable()
+  # wifiEnable() returns right away if Wi-Fi is already enabled.
+  ad.nearby.wifiEnable()
   # return until the wifi is connected.
   password = password or None
   ad.log.info('Connect to wifi: ssid: %s, password: %s', ssid, password)
@@ -231,9 +360,13 @@ def connect_to_wifi(
 
 def remove_disconnect_wifi_network(ad: android_device.AndroidDevice) -> None:
   """Removes and disconnects all wifi network on the given device."""
-  if not ad.is_adb_root:
+  if not is_adb_root(ad):
     ad.log.info("Can't clear wifi network in non-rooted device")
     return
+  # Listing the saved networks is cheap, toggling Wi-Fi to clear them is not.
+  if not android_wifi_utils.list_saved_wifi(ad):
+    ad.log.info('No saved wifi network to clear.')
+    return
   was_wifi_enabled = ad.nearby.wifiIsEnabled()
   if was_wifi_enabled:
     # wifiClearConfiguredNetworks() calls getConfiguredNetworks() and
@@ -266,72 +399,84 @@ def _grant_manage_external_storage_permission(
 
   Args:
     ad: AndroidDevice, Mobly Android Device.
-    package_name: The nearbu snippet package name.
+    package_name: The nearby snippet package name.
   """
+  # Query and grant in one shell call, and only write the appop if it is not
+  # already allowed.
   try:
     ad.adb.shell(
-        f'appops set --uid {package_name} MANAGE_EXTERNAL_STORAGE allow'
+        f'appops get --uid {package_name} MANAGE_EXTERNAL_STORAGE'
+        ' | grep -q allow'
+        f' || appops set --uid {package_name} MANAGE_EXTERNAL_STORAGE allow'
     )
   except adb.Error:
     ad.log.info('Failed to grant MANAGE_EXTERNAL_STORAGE permission.')
 
 
+@_retry_on_adb_error
 def enable_airplane_mode(ad: android_device.AndroidDevice) -> None:
   """Enables airplane mode on the given device."""
-  try:
-    _do_enable_airplane_mode(ad)
-  except adb.AdbError:
-    ad.log.exception(
-        f'Failed to enable airplane mode on device "{ad.serial}", try again.'
-    )
-    time.sleep(ADB_RETRY_WAIT_TIME_SEC)
-    _do_enable_airplane_mode(ad)
-
-
-def _do_enable_airplane_mode(ad: android_device.AndroidDevice) -> None:
-  if ad.is_adb_root:
-    ad.adb.shell(['settings', 'put', 'global', 'airplane_mode_on', '1'])
-    ad.adb.shell([
-        'am',
-        'broadcast',
-        '-a',
-        'android.intent.action.AIRPLANE_MODE',
-        '--ez',
-        'state',
-        'true',
-    ])
-  ad.adb.shell(['svc', 'wifi', 'disable'])
-  ad.adb.shell(['svc', 'bluetooth', 'disable'])
-  time.sleep(TOGGLE_AIRPLANE_MODE_WAIT_TIME_SEC)
+  _set_airplane_mode(ad, True)
 
 
+@_retry_on_adb_error
 def disable_airplane_mode(ad: android_device.AndroidDevice) -> None:
   """Disables airplane mode on the given device."""
+  _set_airplane_mode(ad, False)
+
+
+def _set_airplane_mode(
+    ad: android_device.AndroidDevice, enabled: bool
+) -> None:
+  """Sets airplane mode and the Wi-Fi/BT radios in one adb shell call."""
+  radio_state = 'disable' if enabled else 'enable'
+  cmds = []
+  if is_adb_root(ad):
+    # `cmd connectivity airplane-mode` is only available since Android R.
+    if int(ad.build_info['build_version_sdk']) >= 30:
+      # Updates the setting and notifies the system in one call without
+      # starting an am process for the broadcast.
+      airplane_mode_state = 'enable' if enabled else 'disable'
+      cmds.append(f'cmd connectivity airplane-mode {airplane_mode_state}')
+    else:
+      cmds.append(f'settings put global airplane_mode_on {int(enabled)}')
+      cmds.append(
+          'am broadcast -a android.intent.action.AIRPLANE_MODE'
+          f' --ez state {str(enabled).lower()}'
+      )
+  cmds.append(f'svc wifi {radio_state}')
+  cmds.append(f'svc bluetooth {radio_state}')
+  ad.adb.shell(' && '.join(cmds))
+  # Proceed as soon as both radios report the new state, but no later than the
+  # wait time which was the fixed wait before.
+  wait_utils.wait_for_predicate(
+      lambda: _are_radios_enabled(ad, not enabled),
+      timeout=datetime.timedelta(seconds=TOGGLE_AIRPLANE_MODE_WAIT_TIME_SEC),
+  )
+
+
+def _are_radios_enabled(
+    ad: android_device.AndroidDevice, enabled: bool
+) -> bool:
+  """Returns True if both the Wi-Fi and BT adapters are in the given state."""
+  if android_wifi_utils.is_wifi_enabled(ad) != enabled:
+    return False
+  bluetooth_state = _get_bluetooth_state(ad)
+  if enabled:
+    return bluetooth_state == 'ON'
+  return bluetooth_state in _BLUETOOTH_OFF_STATES
+
+
+def _get_bluetooth_state(ad: android_device.AndroidDevice) -> str:
+  """Returns the Bluetooth adapter state, e.g. ON or OFF."""
   try:
-    _do_disable_airplane_mode(ad)
+    out = ad.adb.shell(
+        "dumpsys bluetooth_manager | grep -m1 -E '^[[:space:]]*state:'"
+    ).decode('utf-8')
   except adb.AdbError:
-    ad.log.exception(
-        f'Failed to disable airplane mode on device "{ad.serial}", try again.'
-    )
-    time.sleep(ADB_RETRY_WAIT_TIME_SEC)
-    _do_disable_airplane_mode(ad)
-
-
-def _do_disable_airplane_mode(ad: android_device.AndroidDevice) -> None:
-  if ad.is_adb_root:
-    ad.adb.shell(['settings', 'put', 'global', 'airplane_mode_on', '0'])
-    ad.adb.shell([
-        'am',
-        'broadcast',
-        '-a',
-        'android.intent.action.AIRPLANE_MODE',
-        '--ez',
-        'state',
-        'false',
-    ])
-  ad.adb.shell(['svc', 'wifi', 'enable'])
-  ad.adb.shell(['svc', 'bluetooth', 'enable'])
-  time.sleep(TOGGLE_AIRPLANE_MODE_WAIT_TIME_SEC)
+    return ''
+  match = _BLUETOOTH_STATE_PATTERN.search(out)
+  return match.group(1) if match else ''
 
 
 def restart_gms(ad: android_device.AndroidDevice) -> None:
@@ -342,31 +487,51 @@ def restart_gms(ad: android_device.AndroidDevice) -> None:
 
 def disable_gms_auto_updates(ad: android_device.AndroidDevice) -> None:
   """Disable GMS auto updates on the given device."""
-  if not ad.is_adb_root:
+  if not is_adb_root(ad):
     ad.log.warning(
         'You should disable the play store auto updates manually on a'
         'unrooted device, otherwise the test may be broken unexpected'
     )
+  from betocq import gms_auto_updates_util  # pylint: disable=g-import-not-at-top
+
   ad.log.info('try to disable GMS Auto Updates.')
-  gms_auto_updates_util.GmsAutoUpdatesUtil(ad).disable_gms_auto_updates()
+  gms_auto_updates_util.GmsAutoUpdatesUtil(
+      ad, is_adb_root=is_adb_root(ad)
+  ).disable_gms_auto_updates()
   time.sleep(_DISABLE_ENABLE_GMS_UPDATE_WAIT_TIME_SEC)
 
 
 def enable_gms_auto_updates(ad: android_device.AndroidDevice) -> None:
   """Enable GMS auto updates on the given device."""
-  if not ad.is_adb_root:
+  if not is_adb_root(ad):
     ad.log.warning(
         'You may enable the play store auto updates manually on a'
         'unrooted device after test.'
     )
+  from betocq import gms_auto_updates_util  # pylint: disable=g-import-not-at-top
+
   ad.log.info('try to enable GMS Auto Updates.')
-  gms_auto_updates_util.GmsAutoUpdatesUtil(ad).enable_gms_auto_updates()
+  gms_auto_updates_util.GmsAutoUpdatesUtil(
+      ad, is_adb_root=is_adb_root(ad)
+  ).enable_gms_auto_updates()
   time.sleep(_DISABLE_ENABLE_GMS_UPDATE_WAIT_TIME_SEC)
 
 
-def get_wifi_sta_frequency(ad: android_device.AndroidDevice) -> int:
-  """Get wifi STA frequency on the given device."""
-  wifi_sta_status = dump_wifi_sta_status(ad)
+def get_wifi_sta_frequency(
+    ad: android_device.AndroidDevice, wifi_sta_status: str | None = None
+) -> int:
+  """Get wifi STA frequency on the given device.
+
+  Args:
+    ad: AndroidDevice, Mobly Android Device.
+    wifi_sta_status: The output of dump_wifi_sta_status if it was already
+      fetched, so several values can be parsed from one dump.
+
+  Returns:
+    The value, or INVALID_INT if it is not found.
+  """
+  if wifi_sta_status is None:
+    wifi_sta_status = dump_wifi_sta_status(ad)
   if not wifi_sta_status:
     return nc_constants.INVALID_INT
   prefix = 'Frequency:'
@@ -376,17 +541,33 @@ def get_wifi_sta_frequency(ad: android_device.AndroidDevice) -> int:
 
 def get_wifi_p2p_frequency(ad: android_device.AndroidDevice) -> int:
   """Get wifi p2p frequency on the given device."""
-  wifi_p2p_status = dump_wifi_p2p_status(ad)
-  if not wifi_p2p_status:
-    return nc_constants.INVALID_INT
   prefix = 'channelFrequency='
   postfix = ', groupRole=GroupOwner'
+  # Only transfer the group owner lines of the dump instead of all of it.
+  try:
+    wifi_p2p_status = ad.adb.shell(
+        f'dumpsys wifip2p | grep -F -- {shlex.quote(postfix)}'
+    ).decode('utf-8')
+  except adb.AdbError:
+    return nc_constants.INVALID_INT
   return get_int_between_prefix_postfix(wifi_p2p_status, prefix, postfix)
 
 
-def get_wifi_sta_max_link_speed(ad: android_device.AndroidDevice) -> int:
-  """Get wifi STA max supported Tx link speed on the given device."""
-  wifi_sta_status = dump_wifi_sta_status(ad)
+def get_wifi_sta_max_link_speed(
+    ad: android_device.AndroidDevice, wifi_sta_status: str | None = None
+) -> int:
+  """Get wifi STA max supported Tx link speed on the given device.
+
+  Args:
+    ad: AndroidDevice, Mobly Android Device.
+    wifi_sta_status: The output of dump_wifi_sta_status if it was already
+      fetched, so several values can be parsed from one dump.
+
+  Returns:
+    The value, or INVALID_INT if it is not found.
+  """
+  if wifi_sta_status is None:
+    wifi_sta_status = dump_wifi_sta_status(ad)
   if not wifi_sta_status:
     return nc_constants.INVALID_INT
   prefix = 'Max Supported Tx Link speed:'
@@ -394,40 +575,47 @@ def get_wifi_sta_max_link_speed(ad: android_device.AndroidDevice) -> int:
   return get_int_between_prefix_postfix(wifi_sta_status, prefix, postfix)
 
 
+@functools.cache
+def _int_between_pattern(prefix: str, postfix: str) -> re.Pattern[str]:
+  """Returns the compiled pattern of an int between prefix and postfix."""
+  return re.compile(re.escape(prefix) + r'\s*(-?\d+)\s*' + re.escape(postfix))
+
+
 def get_int_between_prefix_postfix(
     string: str, prefix: str, postfix: str, search_last: bool = True
 ) -> int:
   """Get int between prefix and postfix by searching prefix and then postfix."""
+  pattern = _int_between_pattern(prefix, postfix)
   if search_last:
-    left_index = string.rfind(prefix)
-    right_index = string.rfind(postfix)
+    match = None
+    for match in pattern.finditer(string):
+      pass
   else:
-    left_index = string.find(prefix)
-    right_index = string.find(postfix)
-  if left_index >= 0 and right_index > left_index:
-    try:
-      return int(string[left_index + len(prefix) : right_index].strip())
-    except ValueError:
-      return nc_constants.INVALID_INT
-  return nc_constants.INVALID_INT
+    match = pattern.search(string)
+  if match is None:
+    return nc_constants.INVALID_INT
+  return int(match.group(1))
 
 
 def dump_wifi_sta_status(ad: android_device.AndroidDevice) -> str:
   """Dumps wifi STA status on the given device."""
+  # The status is short, so filter it here instead of piping it through grep.
   try:
-    return (
-        ad.adb.shell('cmd wifi status | grep WifiInfo').decode('utf-8').strip()
-    )
+    wifi_status = ad.adb.shell('cmd wifi status').decode('utf-8')
   except adb.AdbError:
     return ''
+  return '\n'.join(
+      line.strip() for line in wifi_status.splitlines() if 'WifiInfo' in line
+  )
 
 
-def dump_wifi_p2p_status(ad: android_device.AndroidDevice) -> str:
-  """Dumps wifi p2p status on the given device."""
-  try:
-    return ad.adb.shell('dumpsys wifip2p').decode('utf-8').strip()
-  except adb.AdbError:
-    return ''
+def is_wifi_tdls_supported(ad: android_device.AndroidDevice) -> bool:
+  """Returns whether TDLS is supported on the device, cached per serial."""
+  if ad.serial not in _is_wifi_tdls_supported_cache:
+    _is_wifi_tdls_supported_cache[ad.serial] = (
+        ad.nearby.wifiIsTdlsSupported()
+    )
+  return _is_wifi_tdls_supported_cache[ad.serial]
 
 
 def is_wifi_aware_available(ad: android_device.AndroidDevice) -> bool:
@@ -439,34 +627,68 @@ def is_wifi_aware_available(ad: android_device.AndroidDevice) -> bool:
     return False
 
 
+def is_wifi_aware_available_on_all(
+    ads: Sequence[android_device.AndroidDevice],
+) -> bool:
+  """Checks if Aware is supported on all the given devices.
+
+  The per-device snippet RPCs are issued concurrently, so the check costs the
+  slowest device instead of the sum of all of them.
+
+  Args:
+    ads: The devices to check.
+
+  Returns:
+    True if Aware is available on every device.
+  """
+  return all(
+      utils.concurrent_exec(
+          is_wifi_aware_available,
+          param_list=[[ad] for ad in ads],
+          raise_on_exception=True,
+      )
+  )
+
+
 def get_hardware(ad: android_device.AndroidDevice) -> str:
   """Gets hardware information on the given device."""
-  return ad.adb.getprop('ro.hardware')
+  # ro.hardware is part of the build info snapshot cached by mobly.
+  return ad.build_info.get('hardware') or ad.adb.getprop('ro.hardware')
 
 
 def get_wifi_sta_rssi(ad: android_device.AndroidDevice, ssid: str) -> int:
   """get the scan rssi of the given device and SSID."""
   try:
     scan_result = (
-        ad.adb.shell(f'cmd wifi list-scan-results|grep {ssid}')
+        ad.adb.shell(
+            'cmd wifi list-scan-results'
+            f' | grep -m1 -F -- {shlex.quote(ssid)}'
+        )
         .decode('utf-8')
         .strip()
     )
-    if scan_result:
-      return int(scan_result.split()[2].strip())
-    return nc_constants.INVALID_RSSI
   except adb.AdbError:
     return nc_constants.INVALID_RSSI
+  match = _SCAN_RESULT_RSSI_PATTERN.match(scan_result)
+  if match is None:
+    return nc_constants.INVALID_RSSI
+  return int(match.group(1))
 
 
+@functools.cache
 def _overrides_file_for_target(target: str) -> str:
   """Returns the resource path for the given target."""
+  from betocq import resources  # pylint: disable=g-import-not-at-top
+
   key = target.replace('//', 'google3/').replace(':', '/') + '_generated.txt'
   return resources.GetResourceFilename(key)
 
 
+@functools.cache
 def _get_resource_contents(name: str) -> str:
-  """Returns the contents of the given resource."""
+  """Returns the contents of the given resource, read once per session."""
+  from betocq import resources  # pylint: disable=g-import-not-at-top
+
   file_path = resources.GetResourceFilename(name)
   with open(file_path, 'r') as f:
     return f.read()
@@ -479,6 +701,16 @@ def set_flags(
     enable_2g_ble_scan_throttling: bool = False,
 ):
   """Sets flags on the given device."""
+  # Installing the overrides runs 'adb root', so skip all of the work,
+  # including the resource reads, on an unrooted device.
+  if not is_adb_root(ad):
+    ad.log.info(
+        f'Skipped setting flags on device "{ad.serial}" '
+        'because we do not set flags on unrooted phone.'
+    )
+    return
+  from betocq.gms import hermetic_overrides_partner  # pylint: disable=g-import-not-at-top
+
   template_content = _get_resource_contents(_FLAG_SETUP_TEMPLATE_KEY)
 
   def _install_overrides(target: str, merge_with_existing_overrides: bool):
@@ -491,7 +723,6 @@ def set_flags(
         template_content,
         merge_with_existing_overrides=merge_with_existing_overrides,
     )
-    restart_gms(ad)
 
   _install_overrides(_DEFAULT_OVERRIDES, False)
   _install_overrides(
@@ -506,3 +737,6 @@ def set_flags(
       else _BLE_SCAN_THROTTLING_OFF_OVERRIDES,
       True,
   )
+  # The overrides are merged on the device storage, so GMS only needs to be
+  # restarted once to pick up all of them.
+  restart_gms(ad)
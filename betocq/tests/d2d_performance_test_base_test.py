@@ -0,0 +1,108 @@
+#  Copyright 2024 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Unittest for d2d_performance_test_base."""
+
+import datetime
+import unittest
+from unittest import mock
+
+from mobly import config_parser
+
+from betocq import d2d_performance_test_base
+from betocq import nc_constants
+
+
+def _test_run_config(**user_params) -> config_parser.TestRunConfig:
+  config = config_parser.TestRunConfig()
+  config.log_path = '/tmp'
+  config.summary_writer = None
+  config.user_params = user_params
+  return config
+
+
+class _FakeWifiPerformanceTest(
+    d2d_performance_test_base.D2dPerformanceTestBase
+):
+  """A performance test which requires the 5G AP."""
+
+  def _get_file_transfer_failure_tip(self) -> str:
+    return ''
+
+  def _get_throughput_low_tip(self) -> str:
+    return ''
+
+  @property
+  def _required_wifi_ssids(self) -> tuple[str, ...]:
+    return (self.test_parameters.wifi_5g_ssid,)
+
+
+class D2dPerformanceTestBaseTest(unittest.TestCase):
+  """Tests for the shared D2D performance test logic."""
+
+  def test_required_wifi_ssids_is_abstract(self):
+    """Test that a subclass must declare the Wi-Fi APs it requires."""
+
+    class _NoWifiSsidsTest(d2d_performance_test_base.D2dPerformanceTestBase):
+
+      def _get_file_transfer_failure_tip(self) -> str:
+        return ''
+
+      def _get_throughput_low_tip(self) -> str:
+        return ''
+
+    with self.assertRaises(TypeError):
+      _NoWifiSsidsTest(_test_run_config())
+
+  def test_is_wifi_ap_ready(self):
+    """Test that the AP is ready only if every required SSID is set."""
+    self.assertFalse(
+        _FakeWifiPerformanceTest(_test_run_config())._is_wifi_ap_ready()
+    )
+    self.assertTrue(
+        _FakeWifiPerformanceTest(
+            _test_run_config(wifi_5g_ssid='ssid_5g')
+        )._is_wifi_ap_ready()
+    )
+
+  def test_skip_reason_checks_ap_before_querying_devices(self):
+    """Test that a missing AP skips the class without device queries."""
+    test_class = _FakeWifiPerformanceTest(_test_run_config())
+    with mock.patch.object(
+        test_class, '_check_devices_capabilities'
+    ) as mock_check_devices_capabilities, mock.patch.object(
+        test_class, '_is_upgrade_medium_supported'
+    ) as mock_is_upgrade_medium_supported:
+      skip_reason = test_class._get_skipped_test_class_reason()
+
+    self.assertEqual(skip_reason, 'Wifi AP is not ready for this test.')
+    mock_check_devices_capabilities.assert_not_called()
+    mock_is_upgrade_medium_supported.assert_not_called()
+
+  def test_get_latency_stats(self):
+    """Test the stats of the latencies which were measured."""
+    test_class = _FakeWifiPerformanceTest(_test_run_config())
+    latencies = [
+        datetime.timedelta(seconds=seconds) for seconds in (3, 0.5, 0.2, 1.6)
+    ] + [nc_constants.UNSET_LATENCY]
+
+    stats = test_class._get_latency_stats(latencies)
+
+    self.assertEqual(
+        stats, nc_constants.TestResultStats(4, 2, 0.2, 1.6, 3.0)
+    )
+
+
+if __name__ == '__main__':
+  unittest.main()
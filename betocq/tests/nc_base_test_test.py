@@ -0,0 +1,148 @@
+#  Copyright 2024 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Unittest for nc_base_test."""
+
+import threading
+import unittest
+from unittest import mock
+
+from mobly import config_parser
+
+from betocq import android_wifi_utils
+from betocq import nc_base_test
+from betocq import setup_utils
+
+
+def _test_run_config() -> config_parser.TestRunConfig:
+  config = config_parser.TestRunConfig()
+  config.log_path = '/tmp'
+  config.summary_writer = None
+  config.user_params = {}
+  return config
+
+
+class NcBaseTestTest(unittest.TestCase):
+  """Tests for the shared Nearby Connections test logic."""
+
+  def setUp(self):
+    super().setUp()
+    self.test_class = nc_base_test.NCBaseTestClass(_test_run_config())
+    self.test_class.discoverer = mock.Mock(serial='discoverer_serial')
+    self.test_class.advertiser = mock.Mock(serial='advertiser_serial')
+    self.test_class.advertiser.build_info = {'build_id': 'build_id'}
+    self.enterContext(
+        mock.patch.object(
+            setup_utils, 'dump_gms_version', return_value=243935038
+        )
+    )
+    self.mock_is_wifi_aware_available = self.enterContext(
+        mock.patch.object(
+            setup_utils, 'is_wifi_aware_available', return_value=True
+        )
+    )
+
+  def test_summary_keeps_device_roles_when_source_finishes_last(self):
+    """Test that the device attributes are not swapped by completion order."""
+    advertiser_done = threading.Event()
+
+    def read_device_attributes(ad):
+      if ad is self.test_class.discoverer:
+        # Make the source device the slower one.
+        advertiser_done.wait(timeout=5)
+      else:
+        advertiser_done.set()
+      return [f'serial: {ad.serial}']
+
+    with mock.patch.object(
+        self.test_class,
+        '_read_device_attributes',
+        side_effect=read_device_attributes,
+    ):
+      summary = self.test_class._get_test_summary_dict('PASS')
+
+    self.assertEqual(
+        summary['02_device_source'],
+        'serial: discoverer_serial\nsupport_aware: True',
+    )
+    self.assertEqual(
+        summary['03_device_target'],
+        'serial: advertiser_serial\nsupport_aware: True',
+    )
+    self.assertEqual(summary['06_target_gms_version'], '243935038')
+
+  def test_device_attributes_are_cached_per_serial(self):
+    """Test that repeat summaries do not query the device again."""
+    with mock.patch.object(
+        self.test_class, '_read_device_attributes', return_value=['attr']
+    ) as mock_read_device_attributes:
+      self.test_class._get_device_attributes(self.test_class.advertiser)
+      self.test_class._get_device_attributes(self.test_class.advertiser)
+      self.test_class._get_device_attributes(self.test_class.discoverer)
+
+    self.assertEqual(mock_read_device_attributes.call_count, 2)
+
+  def test_device_attributes_query_aware_every_time(self):
+    """Test that the runtime Aware availability is not cached."""
+    ad = self.test_class.advertiser
+    self.mock_is_wifi_aware_available.side_effect = [True, False]
+    with mock.patch.object(
+        self.test_class, '_read_device_attributes', return_value=['attr']
+    ):
+      first_attributes = self.test_class._get_device_attributes(ad)
+      second_attributes = self.test_class._get_device_attributes(ad)
+
+    self.assertEqual(first_attributes, ['attr', 'support_aware: True'])
+    self.assertEqual(second_attributes, ['attr', 'support_aware: False'])
+
+  def test_setup_android_device_all_steps_order(self):
+    """Test that the per-device setup steps run in their required order."""
+    steps = mock.Mock()
+    ad = self.test_class.advertiser
+    with mock.patch.object(
+        self.test_class,
+        '_setup_android_hw_capability',
+        steps.setup_android_hw_capability,
+    ), mock.patch.object(
+        android_wifi_utils, 'forget_all_wifi', steps.forget_all_wifi
+    ), mock.patch.object(
+        self.test_class, '_setup_android_device', steps.setup_android_device
+    ):
+      self.test_class._setup_android_device_all_steps(ad)
+
+    self.assertEqual(
+        steps.mock_calls,
+        [
+            mock.call.setup_android_hw_capability(ad),
+            mock.call.forget_all_wifi(ad),
+            mock.call.setup_android_device(ad),
+        ],
+    )
+
+  @mock.patch('time.sleep')
+  def test_reset_nearby_connection_stops_both_devices(self, mock_sleep):
+    """Test that both devices stop their session and drop the endpoints."""
+    self.test_class._reset_nearby_connection()
+
+    discoverer_nearby = self.test_class.discoverer.nearby
+    advertiser_nearby = self.test_class.advertiser.nearby
+    discoverer_nearby.stopDiscovery.assert_called_once()
+    discoverer_nearby.stopAllEndpoints.assert_called_once()
+    advertiser_nearby.stopAdvertising.assert_called_once()
+    advertiser_nearby.stopAllEndpoints.assert_called_once()
+    mock_sleep.assert_called_once()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,516 @@
+#  Copyright 2024 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Unittest for setup_utils."""
+
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from mobly.controllers.android_device_lib import adb
+from mobly.controllers.android_device_lib import apk_utils
+
+from betocq import nc_constants
+from betocq import setup_utils
+
+
+def _adb_error() -> adb.AdbError:
+  return adb.AdbError(cmd='adb shell', stdout=b'', stderr=b'', ret_code=1)
+
+
+class SetupUtilsTest(unittest.TestCase):
+  """Tests for the device setup helpers."""
+
+  def setUp(self):
+    super().setUp()
+    # The per-device caches are module level, so isolate them between tests.
+    for cache in (
+        setup_utils._is_adb_root_cache,
+        setup_utils._gms_version_cache,
+        setup_utils._is_wifi_tdls_supported_cache,
+    ):
+      cache.clear()
+      self.addCleanup(cache.clear)
+
+  @mock.patch('time.sleep')
+  def test_dump_gms_version_retries_on_adb_error(self, mock_sleep):
+    """Test that a transient adb failure is retried after a short backoff."""
+    mock_android_device = mock.Mock()
+    mock_android_device.adb.shell.side_effect = [
+        _adb_error(),
+        b'243935038\n',
+    ]
+
+    gms_version = setup_utils.dump_gms_version(mock_android_device)
+
+    self.assertEqual(gms_version, 243935038)
+    mock_sleep.assert_called_once()
+    self.assertLess(
+        mock_sleep.call_args.args[0], setup_utils.ADB_RETRY_BACKOFF_SEC[1]
+    )
+
+  def test_dump_gms_version_is_cached_per_serial(self):
+    """Test that the GMS version is read only once per device."""
+    mock_android_device = mock.Mock(serial='gms_version_test_serial')
+    mock_android_device.adb.shell.return_value = b'243935038\n'
+
+    self.assertEqual(
+        setup_utils.dump_gms_version(mock_android_device), 243935038
+    )
+    self.assertEqual(
+        setup_utils.dump_gms_version(mock_android_device), 243935038
+    )
+    mock_android_device.adb.shell.assert_called_once()
+
+    setup_utils.reset_device_caches(mock_android_device)
+    setup_utils.dump_gms_version(mock_android_device)
+    self.assertEqual(mock_android_device.adb.shell.call_count, 2)
+
+  @mock.patch('time.sleep')
+  def test_dump_gms_version_raises_after_all_retries(self, mock_sleep):
+    """Test that the error of the last attempt is raised to the caller."""
+    mock_android_device = mock.Mock()
+    mock_android_device.adb.shell.side_effect = _adb_error()
+
+    with self.assertRaises(adb.AdbError):
+      setup_utils.dump_gms_version(mock_android_device)
+
+    self.assertEqual(
+        mock_android_device.adb.shell.call_count,
+        len(setup_utils.ADB_RETRY_BACKOFF_SEC) + 1,
+    )
+    self.assertEqual(
+        mock_sleep.call_count, len(setup_utils.ADB_RETRY_BACKOFF_SEC)
+    )
+
+  def test_dump_gms_version_invalid_output(self):
+    """Test that an empty or non-numeric output maps to INVALID_INT."""
+    mock_android_device = mock.Mock()
+    mock_android_device.adb.shell.return_value = b'\n'
+
+    gms_version = setup_utils.dump_gms_version(mock_android_device)
+
+    self.assertEqual(gms_version, nc_constants.INVALID_INT)
+
+  @mock.patch('time.sleep')
+  @mock.patch.object(setup_utils, 'toggle_airplane_mode')
+  def test_set_country_code_fuses_enable_commands(
+      self, unused_mock_toggle_airplane_mode, unused_mock_sleep
+  ):
+    """Test that the country code is applied with Wi-Fi enabling in one call."""
+    mock_android_device = mock.Mock(serial='set_country_code_test_serial')
+    mock_android_device.is_adb_root = True
+    mock_android_device.adb.shell.side_effect = [
+        b'',
+        b'Wifi is disabled\n',
+        b'',
+        b'Wifi is being enabled\nmTelephonyCountryCode: jp\n',
+    ]
+
+    setup_utils.set_country_code(
+        mock_android_device, 'jp', force_telephony_cc=True
+    )
+
+    mock_android_device.adb.shell.assert_called_with(
+        'cmd wifi force-country-code enabled jp'
+        ' && cmd wifi set-wifi-enabled enabled'
+        ' && dumpsys wifi | grep -m1 mTelephonyCountryCode'
+    )
+    self.assertEqual(mock_android_device.adb.shell.call_count, 4)
+    mock_android_device.log.info.assert_called_with(
+        'Telephony country code: mTelephonyCountryCode: jp'
+    )
+
+  @mock.patch('time.sleep')
+  def test_set_country_code_retries_only_failed_step(self, unused_mock_sleep):
+    """Test that an AdbError does not repeat the steps which succeeded."""
+    mock_android_device = mock.Mock(serial='set_country_code_test_serial')
+    mock_android_device.is_adb_root = True
+    mock_android_device.adb.shell.side_effect = [
+        b'',
+        b'Wifi is disabled\n',
+        _adb_error(),
+        b'',
+    ]
+
+    setup_utils.set_country_code(mock_android_device, 'us')
+
+    enable_cmd = mock.call(
+        'cmd wifi force-country-code enabled us'
+        ' && cmd wifi set-wifi-enabled enabled'
+    )
+    self.assertEqual(
+        mock_android_device.adb.shell.call_args_list,
+        [
+            mock.call('cmd wifi set-wifi-enabled disabled'),
+            mock.call(['cmd', 'wifi', 'status']),
+            enable_cmd,
+            enable_cmd,
+        ],
+    )
+
+  @mock.patch('time.sleep')
+  def test_set_country_code_waits_for_wifi_disabled(self, mock_sleep):
+    """Test that the country code is set once Wi-Fi reports disabled."""
+    mock_android_device = mock.Mock(serial='set_country_code_test_serial')
+    mock_android_device.is_adb_root = True
+    mock_android_device.adb.shell.side_effect = [
+        b'',
+        b'Wifi is enabled\n',
+        b'Wifi is disabled\n',
+        b'',
+    ]
+
+    setup_utils.set_country_code(mock_android_device, 'us')
+
+    mock_sleep.assert_called_once()
+    self.assertLess(
+        mock_sleep.call_args.args[0],
+        setup_utils.WIFI_COUNTRYCODE_CONFIG_TIME_SEC,
+    )
+
+  def test_enable_logs_fails_on_any_setting(self):
+    """Test that the logging settings are chained to surface failures."""
+    mock_android_device = mock.Mock(serial='enable_logs_test_serial')
+    mock_android_device.is_adb_root = False
+
+    setup_utils.enable_logs(mock_android_device)
+
+    mock_android_device.adb.shell.assert_called_once_with(
+        ' && '.join(
+            [
+                f'setprop log.tag.{tag} VERBOSE'
+                for tag in setup_utils.NEARBY_LOG_TAGS
+            ]
+            + ['cmd wifi set-verbose-logging enabled']
+        )
+    )
+
+  @mock.patch('time.sleep')
+  def test_enable_airplane_mode_uses_connectivity_cmd(self, unused_mock_sleep):
+    """Test that R+ devices toggle airplane mode without a broadcast."""
+    mock_android_device = mock.Mock(serial='airplane_mode_test_serial')
+    mock_android_device.is_adb_root = True
+    mock_android_device.build_info = {'build_version_sdk': '30'}
+    mock_android_device.adb.shell.side_effect = [
+        b'',
+        b'Wifi is disabled\n',
+        b'  state: OFF\n',
+    ]
+
+    setup_utils.enable_airplane_mode(mock_android_device)
+
+    self.assertEqual(
+        mock_android_device.adb.shell.call_args_list[0],
+        mock.call(
+            'cmd connectivity airplane-mode enable && svc wifi disable'
+            ' && svc bluetooth disable'
+        ),
+    )
+
+  @mock.patch('time.sleep')
+  def test_disable_airplane_mode_before_r_uses_broadcast(
+      self, unused_mock_sleep
+  ):
+    """Test that pre-R devices still write the setting and broadcast it."""
+    mock_android_device = mock.Mock(serial='airplane_mode_test_serial')
+    mock_android_device.is_adb_root = True
+    mock_android_device.build_info = {'build_version_sdk': '29'}
+    mock_android_device.adb.shell.side_effect = [
+        b'',
+        b'Wifi is enabled\n',
+        b'  state: ON\n',
+    ]
+
+    setup_utils.disable_airplane_mode(mock_android_device)
+
+    self.assertEqual(
+        mock_android_device.adb.shell.call_args_list[0],
+        mock.call(
+            'settings put global airplane_mode_on 0'
+            ' && am broadcast -a android.intent.action.AIRPLANE_MODE'
+            ' --ez state false && svc wifi enable && svc bluetooth enable'
+        ),
+    )
+
+  @mock.patch('time.sleep')
+  def test_enable_airplane_mode_waits_for_both_radios_off(self, mock_sleep):
+    """Test that the toggle waits while Bluetooth is still turning off."""
+    mock_android_device = mock.Mock(serial='radios_off_test_serial')
+    mock_android_device.is_adb_root = False
+    mock_android_device.adb.shell.side_effect = [
+        b'',
+        b'Wifi is disabled\n',
+        b'  state: TURNING_OFF\n',
+        b'Wifi is disabled\n',
+        b'  state: BLE_ON\n',
+    ]
+
+    setup_utils.enable_airplane_mode(mock_android_device)
+
+    self.assertEqual(mock_android_device.adb.shell.call_count, 5)
+    mock_sleep.assert_called_once()
+    self.assertLess(
+        mock_sleep.call_args.args[0],
+        setup_utils.TOGGLE_AIRPLANE_MODE_WAIT_TIME_SEC,
+    )
+
+  @mock.patch('time.sleep')
+  def test_disable_airplane_mode_waits_for_both_radios_on(self, mock_sleep):
+    """Test that one radio back on is not enough to end the wait."""
+    mock_android_device = mock.Mock(serial='radios_on_test_serial')
+    mock_android_device.is_adb_root = False
+    mock_android_device.adb.shell.side_effect = [
+        b'',
+        b'Wifi is enabled\n',
+        b'  state: TURNING_ON\n',
+        b'Wifi is enabled\n',
+        b'  state: ON\n',
+    ]
+
+    setup_utils.disable_airplane_mode(mock_android_device)
+
+    self.assertEqual(mock_android_device.adb.shell.call_count, 5)
+    mock_sleep.assert_called_once()
+
+  def test_get_bluetooth_state_from_indented_dump(self):
+    """Test that the state line of a real dump is matched and parsed."""
+    bluetooth_manager_dump = (
+        'Bluetooth Status\n'
+        '  enabled: true\n'
+        '  state: ON\n'
+        '  address: XX:XX:XX:XX:12:34\n'
+        '  name: Pixel 8\n'
+        '  time since enabled: 00:10:37.361\n'
+    )
+    mock_android_device = mock.Mock(serial='bluetooth_state_test_serial')
+
+    def shell(cmd):
+      # Emulate the on-device grep, which only knows POSIX classes.
+      self.assertIn("grep -m1 -E '^[[:space:]]*state:'", cmd)
+      for line in bluetooth_manager_dump.splitlines():
+        if line.lstrip(' \t').startswith('state:'):
+          return f'{line}\n'.encode('utf-8')
+      raise _adb_error()
+
+    mock_android_device.adb.shell.side_effect = shell
+
+    self.assertEqual(
+        setup_utils._get_bluetooth_state(mock_android_device), 'ON'
+    )
+
+  def test_is_adb_root_is_cached_per_serial(self):
+    """Test that the root probe runs only once per device."""
+    mock_android_device = mock.Mock(serial='is_adb_root_test_serial')
+    is_adb_root = mock.PropertyMock(return_value=True)
+    type(mock_android_device).is_adb_root = is_adb_root
+
+    self.assertTrue(setup_utils.is_adb_root(mock_android_device))
+    self.assertTrue(setup_utils.is_adb_root(mock_android_device))
+
+    is_adb_root.assert_called_once()
+
+    setup_utils.reset_device_caches(mock_android_device)
+    self.assertTrue(setup_utils.is_adb_root(mock_android_device))
+    self.assertEqual(is_adb_root.call_count, 2)
+
+  def test_is_wifi_tdls_supported_is_cached_per_serial(self):
+    """Test that the TDLS capability RPC runs only once per device."""
+    mock_android_device = mock.Mock(serial='tdls_test_serial')
+    mock_android_device.nearby.wifiIsTdlsSupported.return_value = False
+
+    self.assertFalse(setup_utils.is_wifi_tdls_supported(mock_android_device))
+    self.assertFalse(setup_utils.is_wifi_tdls_supported(mock_android_device))
+
+    mock_android_device.nearby.wifiIsTdlsSupported.assert_called_once()
+
+  def test_get_int_between_prefix_postfix(self):
+    """Test that the first or last int between prefix and postfix is found."""
+    string = 'Frequency: 2437MHz, RSSI: -50, Frequency: 5180 MHz, Link: 1Mbps'
+
+    self.assertEqual(
+        setup_utils.get_int_between_prefix_postfix(string, 'Frequency:', 'MHz'),
+        5180,
+    )
+    self.assertEqual(
+        setup_utils.get_int_between_prefix_postfix(
+            string, 'Frequency:', 'MHz', search_last=False
+        ),
+        2437,
+    )
+    self.assertEqual(
+        setup_utils.get_int_between_prefix_postfix(string, 'RSSI:', ','), -50
+    )
+    self.assertEqual(
+        setup_utils.get_int_between_prefix_postfix(string, 'Link:', 'MHz'),
+        nc_constants.INVALID_INT,
+    )
+
+  def test_get_wifi_sta_values_from_one_dump(self):
+    """Test that a fetched STA status dump is parsed without adb calls."""
+    mock_android_device = mock.Mock()
+    wifi_sta_status = (
+        'WifiInfo: SSID: "AP", Frequency: 5180MHz,'
+        ' Max Supported Tx Link speed: 1200Mbps'
+    )
+
+    self.assertEqual(
+        setup_utils.get_wifi_sta_frequency(
+            mock_android_device, wifi_sta_status
+        ),
+        5180,
+    )
+    self.assertEqual(
+        setup_utils.get_wifi_sta_max_link_speed(
+            mock_android_device, wifi_sta_status
+        ),
+        1200,
+    )
+    mock_android_device.adb.shell.assert_not_called()
+
+  def test_get_wifi_sta_rssi_reads_first_match(self):
+    """Test that the scan results are filtered on the device by fixed SSID."""
+    mock_android_device = mock.Mock()
+    mock_android_device.adb.shell.return_value = (
+        b'  aa:bb:cc:dd:ee:ff  5180  -45  1.2  My AP  [WPA2-PSK-CCMP]\n'
+    )
+
+    rssi = setup_utils.get_wifi_sta_rssi(mock_android_device, 'My AP')
+
+    self.assertEqual(rssi, -45)
+    mock_android_device.adb.shell.assert_called_once_with(
+        "cmd wifi list-scan-results | grep -m1 -F -- 'My AP'"
+    )
+
+  def test_dump_wifi_sta_status_keeps_wifi_info_lines(self):
+    """Test that only the WifiInfo lines of the Wi-Fi status are returned."""
+    mock_android_device = mock.Mock()
+    mock_android_device.adb.shell.return_value = (
+        b'Wifi is enabled\n'
+        b'WifiInfo: SSID: "AP", Frequency: 5180MHz\n'
+        b'successful RSSI poll\n'
+    )
+
+    wifi_sta_status = setup_utils.dump_wifi_sta_status(mock_android_device)
+
+    self.assertEqual(
+        wifi_sta_status, 'WifiInfo: SSID: "AP", Frequency: 5180MHz'
+    )
+    mock_android_device.adb.shell.assert_called_once_with('cmd wifi status')
+
+  def test_get_wifi_sta_rssi_invalid_line(self):
+    """Test that a line without the RSSI column maps to INVALID_RSSI."""
+    mock_android_device = mock.Mock()
+    mock_android_device.adb.shell.return_value = b'My AP is not a scan result\n'
+
+    rssi = setup_utils.get_wifi_sta_rssi(mock_android_device, 'My AP')
+
+    self.assertEqual(rssi, nc_constants.INVALID_RSSI)
+
+  def test_get_wifi_p2p_frequency_filters_on_device(self):
+    """Test that only the group owner lines of the p2p dump are read."""
+    mock_android_device = mock.Mock()
+    mock_android_device.adb.shell.return_value = (
+        b'  channelFrequency=2437, groupRole=GroupOwner\n'
+        b'  mGroup: channelFrequency=5180, groupRole=GroupOwner\n'
+    )
+
+    p2p_frequency = setup_utils.get_wifi_p2p_frequency(mock_android_device)
+
+    self.assertEqual(p2p_frequency, 5180)
+    mock_android_device.adb.shell.assert_called_once_with(
+        "dumpsys wifip2p | grep -F -- ', groupRole=GroupOwner'"
+    )
+
+  @mock.patch.object(apk_utils, 'install')
+  def test_install_apk_if_changed_skips_same_apk(self, mock_install):
+    """Test that the install is skipped if the device has the same APK."""
+    apk_path = os.path.join(tempfile.mkdtemp(), 'snippet.apk')
+    with open(apk_path, 'wb') as f:
+      f.write(b'apk')
+    digest = hashlib.sha256(b'apk').hexdigest()
+    mock_android_device = mock.Mock()
+    mock_android_device.adb.shell.return_value = (
+        f'{digest}  /data/app/base.apk\n'.encode()
+    )
+
+    setup_utils.install_apk_if_changed(
+        mock_android_device, apk_path, 'com.example'
+    )
+    mock_install.assert_not_called()
+
+    setup_utils.install_apk_if_changed(
+        mock_android_device, apk_path, 'com.example', force_reinstall=True
+    )
+    mock_install.assert_called_once_with(mock_android_device, apk_path)
+
+  @mock.patch.object(apk_utils, 'install')
+  def test_install_apk_if_changed_installs_missing_apk(self, mock_install):
+    """Test that the APK is installed if the package is not on the device."""
+    apk_path = os.path.join(tempfile.mkdtemp(), 'snippet.apk')
+    with open(apk_path, 'wb') as f:
+      f.write(b'apk')
+    mock_android_device = mock.Mock()
+    mock_android_device.adb.shell.side_effect = _adb_error()
+
+    setup_utils.install_apk_if_changed(
+        mock_android_device, apk_path, 'com.example'
+    )
+
+    mock_install.assert_called_once_with(mock_android_device, apk_path)
+
+  def test_remove_disconnect_wifi_network_skips_without_networks(self):
+    """Test that Wi-Fi is not toggled when no network is saved."""
+    mock_android_device = mock.Mock(serial='remove_wifi_test_serial')
+    mock_android_device.is_adb_root = True
+    mock_android_device.adb.shell.return_value = b'No networks\n'
+
+    setup_utils.remove_disconnect_wifi_network(mock_android_device)
+
+    mock_android_device.nearby.wifiDisable.assert_not_called()
+    mock_android_device.nearby.wifiClearConfiguredNetworks.assert_not_called()
+
+  @mock.patch.object(setup_utils, '_get_resource_contents')
+  def test_set_flags_skips_unrooted_device(self, mock_get_resource_contents):
+    """Test that no override work is done on an unrooted device."""
+    mock_android_device = mock.Mock(serial='set_flags_test_serial')
+    mock_android_device.is_adb_root = False
+
+    setup_utils.set_flags(mock_android_device, output_path='/tmp')
+
+    mock_get_resource_contents.assert_not_called()
+    mock_android_device.adb.shell.assert_not_called()
+    mock_android_device.adb.root.assert_not_called()
+
+  def test_is_wifi_aware_available_on_all(self):
+    """Test that Aware is reported only if every device supports it."""
+    mock_advertiser = mock.Mock()
+    mock_advertiser.nearby.wifiAwareIsAvailable.return_value = True
+    mock_discoverer = mock.Mock()
+    mock_discoverer.nearby.wifiAwareIsAvailable.return_value = False
+
+    self.assertTrue(
+        setup_utils.is_wifi_aware_available_on_all([mock_advertiser])
+    )
+    self.assertFalse(
+        setup_utils.is_wifi_aware_available_on_all(
+            [mock_advertiser, mock_discoverer]
+        )
+    )
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,69 @@
+#  Copyright 2024 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Unittest for wait_utils."""
+
+import datetime
+import unittest
+from unittest import mock
+
+from betocq import wait_utils
+
+
+class WaitUtilsTest(unittest.TestCase):
+  """Tests for the polling helpers."""
+
+  @mock.patch('time.sleep')
+  @mock.patch('time.monotonic_ns', return_value=0)
+  def test_wait_for_predicate_backs_off(
+      self, unused_mock_monotonic, mock_sleep
+  ):
+    """Test that the polling interval grows geometrically up to the cap."""
+    predicate = mock.Mock(side_effect=[False, False, False, False, True])
+
+    result = wait_utils.wait_for_predicate(
+        predicate,
+        timeout=datetime.timedelta(seconds=10),
+        initial_interval=datetime.timedelta(seconds=0.1),
+        max_interval=datetime.timedelta(seconds=0.3),
+        backoff=2,
+    )
+
+    self.assertTrue(result)
+    self.assertEqual(
+        [c.args[0] for c in mock_sleep.call_args_list], [0.1, 0.2, 0.3, 0.3]
+    )
+
+  @mock.patch('time.sleep')
+  @mock.patch(
+      'time.monotonic_ns', side_effect=[0, 0, 900_000_000, 1_000_000_000]
+  )
+  def test_wait_for_predicate_timeout(self, unused_mock_monotonic, mock_sleep):
+    """Test that the last wait is clamped to the deadline."""
+    predicate = mock.Mock(return_value=False)
+
+    result = wait_utils.wait_for_predicate(
+        predicate,
+        timeout=datetime.timedelta(seconds=1),
+        interval=datetime.timedelta(seconds=0.5),
+    )
+
+    self.assertFalse(result)
+    self.assertEqual(predicate.call_count, 3)
+    self.assertEqual(mock_sleep.call_args_list[0].args[0], 0.5)
+    self.assertAlmostEqual(mock_sleep.call_args_list[1].args[0], 0.1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,69 @@
+#  Copyright 2024 Google LLC
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Utils for waiting on device state changes."""
+
+import datetime
+import time
+from typing import Callable
+
+POLL_INITIAL_INTERVAL = datetime.timedelta(milliseconds=50)
+POLL_MAX_INTERVAL = datetime.timedelta(seconds=1)
+POLL_BACKOFF_FACTOR = 1.5
+
+_ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def wait_for_predicate(
+    predicate: Callable[[], bool],
+    timeout: datetime.timedelta,
+    interval: datetime.timedelta | None = None,
+    initial_interval: datetime.timedelta = POLL_INITIAL_INTERVAL,
+    max_interval: datetime.timedelta = POLL_MAX_INTERVAL,
+    backoff: float = POLL_BACKOFF_FACTOR,
+) -> bool:
+  """Waits until the predicate returns True or the timeout expires.
+
+  The predicate is polled quickly at first and then less often: the wait
+  between checks starts at initial_interval and is multiplied by backoff up to
+  max_interval. The last wait is clamped to the deadline.
+
+  Args:
+    predicate: The condition to wait for.
+    timeout: The max time to wait.
+    interval: If set, poll at this fixed interval instead of backing off.
+    initial_interval: The first wait between two checks.
+    max_interval: The upper bound of the wait between two checks.
+    backoff: The factor applied to the wait after each check.
+
+  Returns:
+    True if the predicate returned True before the timeout, False otherwise.
+  """
+  # The deadline is kept in integer nanoseconds, and the intervals are converted
+  # to seconds once before the loop.
+  deadline_ns = time.monotonic_ns() + timeout // _ONE_MICROSECOND * 1000
+  if interval is not None:
+    wait_sec = max_wait_sec = interval.total_seconds()
+    backoff = 1
+  else:
+    wait_sec = initial_interval.total_seconds()
+    max_wait_sec = max_interval.total_seconds()
+  while True:
+    if predicate():
+      return True
+    remaining_ns = deadline_ns - time.monotonic_ns()
+    if remaining_ns <= 0:
+      return False
+    time.sleep(min(wait_sec, remaining_ns / 1e9))
+    wait_sec = min(wait_sec * backoff, max_wait_sec)